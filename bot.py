@@ -1,16 +1,22 @@
 import os
+import functools
+import io
+import csv
+import sqlite3
+import re
+import secrets
+import signal
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
-import pandas as pd
+from typing import Awaitable, Callable, Iterable, List, Dict, Optional, Tuple
+from python_calamine import CalamineWorkbook
 from dotenv import load_dotenv
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from threading import Thread
 import time
-import urllib.request
-import json
-from telegram import Update, Document, InlineKeyboardButton, InlineKeyboardMarkup
+import orjson
+from aiohttp import web
+from telegram import Update, CallbackQuery, Document, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -19,9 +25,12 @@ from telegram.ext import (
     filters,
     ContextTypes
 )
-import tweepy
+import httpx
+from authlib.oauth1 import ClientAuth
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -39,20 +48,108 @@ TWITTER_ACCESS_TOKEN = os.environ["TWITTER_ACCESS_TOKEN"]
 TWITTER_ACCESS_SECRET = os.environ["TWITTER_ACCESS_SECRET"]
 TWITTER_BEARER_TOKEN = os.environ["TWITTER_BEARER_TOKEN"]
 HEALTH_PORT = int(os.environ.get("HEALTH_PORT", "8080"))
+TWITTER_API_URL = "https://api.twitter.com/2"
+QUEUE_DB_PATH = os.environ.get("QUEUE_DB_PATH", "queue.db")
+PREVIEW_LENGTH = 150
+MAX_TWEET_LENGTH = 280
+FIRST_POST_DELAY = timedelta(seconds=5)
+# Public HTTPS base URL of this service; when set the bot uses webhooks
+PUBLIC_URL = os.environ.get("PUBLIC_URL", "").rstrip("/")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+HEALTH_PING_URL = "https://yapbot-933z.onrender.com/ready"
+HEALTH_PING_INTERVAL = 30
 
 if not all([TELEGRAM_BOT_TOKEN, TWITTER_API_KEY, TWITTER_API_SECRET,
            TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_SECRET, TWITTER_BEARER_TOKEN]):
     raise ValueError("Missing required environment variables")
 
-tweet_queue: List[Dict] = []
-scheduler = None
- 
-def _latest_post_time() -> str:
-    try:
-        posted_times = [str(t.get('posted_at')) for t in tweet_queue if t.get('posted') and t.get('posted_at')]
-        return max(posted_times) if posted_times else ""
-    except Exception:
-        return ""
+class TweetStore:
+    """Tweets to post, in file order, persisted in SQLite.
+
+    The queue survives restarts and only the rows being shown or posted are
+    loaded into memory. Totals are kept as counters so status and health
+    checks never have to count rows.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tweets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            preview TEXT NOT NULL,
+            posted INTEGER NOT NULL DEFAULT 0,
+            tweet_id TEXT,
+            posted_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ix_tweets_unposted ON tweets(id) WHERE posted = 0;
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.total, self.posted_count, last_posted_at = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(posted), 0), MAX(posted_at) FROM tweets"
+        ).fetchone()
+        self.last_posted_at: str = last_posted_at or ""
+
+    def __len__(self) -> int:
+        return self.total
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.posted_count
+
+    def replace(self, texts: List[str]) -> None:
+        """Replace the whole queue with `texts` in a single transaction"""
+        with self.conn:
+            self.conn.execute("DELETE FROM tweets")
+            self.conn.executemany(
+                "INSERT INTO tweets (text, preview) VALUES (?, ?)",
+                ((t, t[:PREVIEW_LENGTH]) for t in texts)
+            )
+        self.total = len(texts)
+        self.posted_count = 0
+        self.last_posted_at = ""
+
+    def clear(self) -> None:
+        self.replace([])
+
+    def next_tweet(self) -> Optional[Tuple[int, str, str]]:
+        """Return (row_id, text, preview) of the next unposted tweet, or None when all are posted"""
+        return self.conn.execute(
+            "SELECT id, text, preview FROM tweets WHERE posted = 0 ORDER BY id LIMIT 1"
+        ).fetchone()
+
+    def next_preview(self) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT preview FROM tweets WHERE posted = 0 ORDER BY id LIMIT 1"
+        ).fetchone()
+        return row[0] if row else None
+
+    def upcoming(self, limit: int) -> List[str]:
+        """Return previews of up to `limit` unposted tweets"""
+        rows = self.conn.execute(
+            "SELECT preview FROM tweets WHERE posted = 0 ORDER BY id LIMIT ?", (limit,)
+        )
+        return [preview for (preview,) in rows]
+
+    def mark_posted(self, row_id: int, tweet_id: Optional[str]) -> None:
+        """Mark a tweet as posted; a no-op if the queue was replaced meanwhile"""
+        posted_at = datetime.now().isoformat(timespec='seconds')
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE tweets SET posted = 1, tweet_id = ?, posted_at = ? WHERE id = ? AND posted = 0",
+                (tweet_id, posted_at, row_id)
+            )
+        if cur.rowcount:
+            self.posted_count += 1
+            self.last_posted_at = posted_at
+
+tweet_queue = TweetStore(QUEUE_DB_PATH)
+
+HEALTH_CACHE_TTL = 0.5
+_health_cache: Tuple[float, bytes] = (0.0, b'')
 
 def get_health() -> Dict:
     sch = None
@@ -62,116 +159,236 @@ def get_health() -> Dict:
         sch = None
     return {
         "status": "ok",
-        "queue_size": len([t for t in tweet_queue if not t.get('posted')]),
+        "queue_size": tweet_queue.remaining,
         "total_items": len(tweet_queue),
         "scheduler_running": bool(getattr(sch, 'running', False)),
         "jobs": len(sch.get_jobs()) if sch else 0,
-        "last_posted_at": _latest_post_time()
+        "last_posted_at": tweet_queue.last_posted_at
     }
 
-class HealthHandler(BaseHTTPRequestHandler):
-    def do_GET(self):  # noqa: N802
-        if self.path in ("/", "/healthz", "/live", "/ready"):
-            payload = get_health()
-            body = json.dumps(payload).encode("utf-8")
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Content-Length", str(len(body)))
-            self.end_headers()
-            self.wfile.write(body)
-        else:
-            self.send_response(404)
-            self.end_headers()
+async def health(request: web.Request) -> web.Response:
+    """Serve get_health(), re-encoding at most once per HEALTH_CACHE_TTL"""
+    global _health_cache
+    now = time.monotonic()
+    cached_at, body = _health_cache
+    if not body or now - cached_at >= HEALTH_CACHE_TTL:
+        body = orjson.dumps(get_health())
+        _health_cache = (now, body)
+    return web.Response(body=body, content_type="application/json")
 
-def start_health_server(port: int = HEALTH_PORT):
-    def _serve():
-        try:
-            httpd = HTTPServer(("0.0.0.0", port), HealthHandler)
-            logger.info(f"Health server listening on 0.0.0.0:{port}")
-            httpd.serve_forever()
-        except Exception as e:
-            logger.error(f"Health server failed: {e}")
-    Thread(target=_serve, daemon=True).start()
+async def start_web_server(application: Application) -> None:
+    """Serve the health endpoints, and the Telegram webhook when enabled,
+    from the bot's own event loop on HEALTH_PORT.
+    """
+    app = web.Application()
+    for path in ("/", "/healthz", "/live", "/ready"):
+        app.router.add_get(path, health)
+    
+    if PUBLIC_URL:
+        async def telegram_webhook(request: web.Request) -> web.Response:
+            token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not secrets.compare_digest(token, WEBHOOK_SECRET):
+                return web.Response(status=403)
+            # Acknowledge right away; handlers run off the update queue
+            update = Update.de_json(await request.json(), application.bot)
+            await application.update_queue.put(update)
+            return web.Response()
+        
+        app.router.add_post(f"/{TELEGRAM_BOT_TOKEN}", telegram_webhook)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, "0.0.0.0", HEALTH_PORT).start()
+    except OSError as e:
+        logger.error("Web server failed: %s", e)
+        await runner.cleanup()
+        if PUBLIC_URL:
+            raise
+        return
+    application.bot_data['web_runner'] = runner
+    logger.info("Web server listening on 0.0.0.0:%s", HEALTH_PORT)
+
+async def stop_web_server(application: Application) -> None:
+    runner = application.bot_data.pop('web_runner', None)
+    if runner is not None:
+        await runner.cleanup()
 
-def start_health_ping(interval: int = 30, url: str = "http://localhost:8080/healthz"):
-    def _ping():
+async def startup(application: Application) -> None:
+    await start_web_server(application)
+    start_health_ping(application, HEALTH_PING_INTERVAL, HEALTH_PING_URL)
+
+async def shutdown(application: Application) -> None:
+    """Release network resources once the bot has stopped"""
+    await stop_health_ping(application)
+    await stop_web_server(application)
+    await tweet_poster.aclose()
+
+async def run_webhook(application: Application) -> None:
+    """Run the bot on updates pushed by Telegram instead of long polling"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    try:
+        async with application:
+            await startup(application)
+            await application.bot.set_webhook(
+                url=f"{PUBLIC_URL}/{TELEGRAM_BOT_TOKEN}",
+                allowed_updates=Update.ALL_TYPES,
+                secret_token=WEBHOOK_SECRET
+            )
+            await application.start()
+            logger.info("Webhook registered at %s", PUBLIC_URL)
+            await stop.wait()
+            await application.stop()
+    finally:
+        await shutdown(application)
+
+async def _health_ping(interval: int, url: str) -> None:
+    async with httpx.AsyncClient(timeout=5) as client:
         while True:
             try:
-                with urllib.request.urlopen(url, timeout=5) as resp:
-                    if resp.status == 200:
-                        data = resp.read()
-                        import json
-                        payload = json.loads(data)
-                        logger.info(f"[HEALTH] status={payload.get('status')} queue={payload.get('queue_size')} jobs={payload.get('jobs')}")
-                    else:
-                        logger.warning(f"[HEALTH] Non-200 response: {resp.status}")
+                resp = await client.get(url)
+                if resp.status_code == 200:
+                    payload = orjson.loads(resp.content)
+                    logger.info("[HEALTH] status=%s queue=%s jobs=%s", payload.get('status'), payload.get('queue_size'), payload.get('jobs'))
+                else:
+                    logger.warning("[HEALTH] Non-200 response: %s", resp.status_code)
             except Exception as e:
-                logger.error(f"[HEALTH] Ping failed: {e}")
-            time.sleep(interval)
-    Thread(target=_ping, daemon=True).start()
+                logger.error("[HEALTH] Ping failed: %s", e)
+            await asyncio.sleep(interval)
 
-def get_scheduler():
-    """Get or create the scheduler"""
-    global scheduler
-    try:
-        if scheduler is not None and scheduler.running:
-            return scheduler
-    except Exception:
-        pass
-        
+def start_health_ping(application: Application, interval: int = 30, url: str = "http://localhost:8080/healthz") -> None:
+    """Keep the service awake by polling its health URL from the bot's loop"""
+    application.bot_data['health_ping'] = asyncio.create_task(_health_ping(interval, url))
+
+async def stop_health_ping(application: Application) -> None:
+    task = application.bot_data.pop('health_ping', None)
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+@functools.lru_cache(maxsize=1)
+def _create_scheduler() -> AsyncIOScheduler:
+    # Jobs run as coroutines directly on the bot's loop; only call this from
+    # a handler or job so there is a running loop to bind to
     scheduler = AsyncIOScheduler(
+        event_loop=asyncio.get_running_loop(),
         job_defaults={
-            'coalesce': False,
+            'coalesce': True,
             'max_instances': 1,
-            'misfire_grace_time': None
+            'misfire_grace_time': 300
         }
     )
     scheduler.start()
     logger.info("Created and started new scheduler")
     return scheduler
 
+def get_scheduler() -> AsyncIOScheduler:
+    """Get or create the scheduler"""
+    scheduler = _create_scheduler()
+    if not scheduler.running:
+        # The cached scheduler was shut down; drop it and start a new one
+        _create_scheduler.cache_clear()
+        scheduler = _create_scheduler()
+    return scheduler
+
+def set_tweet_job(scheduler, trigger, bot, chat_id) -> None:
+    """Point the single posting job at `trigger`, creating it on first use"""
+    try:
+        scheduler.reschedule_job('tweet_job', trigger=trigger)
+        scheduler.modify_job('tweet_job', args=[bot, chat_id])
+    except JobLookupError:
+        scheduler.add_job(post_next_tweet, trigger, args=[bot, chat_id], id='tweet_job')
+    if isinstance(trigger, IntervalTrigger):
+        # Post the first tweet right away instead of a full interval from now
+        # (or from a shared preset trigger's start_date); later runs follow
+        # on from it
+        scheduler.modify_job('tweet_job', next_run_time=datetime.now(trigger.timezone) + FIRST_POST_DELAY)
+
+class OAuth1HeaderAuth(httpx.Auth):
+    """OAuth 1.0a user-context auth that only adds the Authorization header.
+
+    Authlib's OAuth1Auth empties any body that is not form-encoded, which
+    would post the JSON payload as nothing. JSON bodies are not part of
+    the signature, so sign with an empty body and send the request as is.
+    """
+    
+    def __init__(self, client_id: str, client_secret: str, token: str, token_secret: str):
+        self._client_auth = ClientAuth(
+            client_id=client_id,
+            client_secret=client_secret,
+            token=token,
+            token_secret=token_secret
+        )
+    
+    def auth_flow(self, request: httpx.Request):
+        _, headers, _ = self._client_auth.sign(request.method, str(request.url), {}, b'')
+        request.headers['Authorization'] = headers['Authorization']
+        yield request
+
 class TweetPoster:
-    """Handles Twitter API interactions"""
+    """Handles Twitter API interactions.
+
+    A single HTTP/2 client is kept for the life of the bot so scheduled
+    posts reuse the open connection instead of redoing the TLS handshake.
+    """
     
     def __init__(self):
-        self.client = tweepy.Client(
-            bearer_token=TWITTER_BEARER_TOKEN,
-            consumer_key=TWITTER_API_KEY,
-            consumer_secret=TWITTER_API_SECRET,
-            access_token=TWITTER_ACCESS_TOKEN,
-            access_token_secret=TWITTER_ACCESS_SECRET
+        self.client = httpx.AsyncClient(
+            base_url=TWITTER_API_URL,
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                # Only connection failures are retried, so a tweet is never sent twice
+                retries=2,
+                limits=httpx.Limits(
+                    max_connections=4,
+                    max_keepalive_connections=1,
+                    keepalive_expiry=120.0
+                )
+            ),
+            auth=OAuth1HeaderAuth(
+                client_id=TWITTER_API_KEY,
+                client_secret=TWITTER_API_SECRET,
+                token=TWITTER_ACCESS_TOKEN,
+                token_secret=TWITTER_ACCESS_SECRET
+            ),
+            timeout=30.0
         )
         logger.info("TweetPoster initialized")
     
-    def post_tweet(self, text: str) -> Tuple[bool, Optional[str]]:
-        """Post a tweet to Twitter.
+    async def post_tweet(self, text: str) -> Tuple[bool, Optional[str]]:
+        """Post a tweet to Twitter without blocking the event loop.
         Returns (success, tweet_id) where tweet_id is None on failure.
         """
         try:
-            response = self.client.create_tweet(text=text)
-            tweet_id: Optional[str] = None
-            data = getattr(response, 'data', None)
-            if data is not None:
-                if isinstance(data, dict):
-                    tweet_id = data.get('id') or data.get('tweet_id')
-                else:
-                    tweet_id = getattr(data, 'id', None)
+            response = await self.client.post("/tweets", json={"text": text})
+            if response.is_error:
+                # Twitter explains rejections (duplicate content, etc.) in the body
+                logger.error("Error posting tweet: HTTP %s %s", response.status_code, response.text)
+                return False, None
+            data = response.json().get('data') or {}
+            tweet_id = data.get('id')
             if tweet_id:
-                logger.info(f"Tweet posted successfully: {tweet_id}")
+                logger.info("Tweet posted successfully: %s", tweet_id)
                 return True, str(tweet_id)
             logger.error("Tweet response missing ID; treating as failure")
             return False, None
         except Exception as e:
-            logger.error(f"Error posting tweet: {e}")
+            logger.error("Error posting tweet: %s", e)
             return False, None
 
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
 tweet_poster = TweetPoster()
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Send welcome message when /start command is issued"""
-    if not update.message:
-        return
-    welcome_message = """
+WELCOME_MESSAGE = """
 🤖 *Tweet Scheduler Bot*
 
 Welcome! This bot helps you schedule and post tweets automatically.
@@ -182,31 +399,9 @@ Welcome! This bot helps you schedule and post tweets automatically.
 3. Let the bot handle the rest!
 
 Ready to get started? Choose an option below:
-    """
-    
-    keyboard = [
-        [
-            InlineKeyboardButton("📤 Upload Tweets", callback_data="help_upload"),
-            InlineKeyboardButton("📊 Check Status", callback_data="status")
-        ],
-        [
-            InlineKeyboardButton("⏰ Set Schedule", callback_data="help_schedule"),
-            InlineKeyboardButton("❓ Help", callback_data="help")
-        ],
-        [
-            InlineKeyboardButton("🗑️ Clear Queue", callback_data="confirm_clear")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(welcome_message, parse_mode='Markdown', reply_markup=reply_markup)
+"""
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Send detailed help information"""
-    if not update.message:
-        return
-        
-    help_text = """
+HELP_MESSAGE = """
 📖 *Detailed Help*
 
 *Spreadsheet Format:*
@@ -238,13 +433,218 @@ Use /schedule command followed by interval:
 - Tweets are posted in the order they appear in your file
 - Maximum tweet length is 280 characters
 - Bot will skip tweets that are too long
+"""
+
+MENU_MESSAGE = """
+🤖 *Tweet Scheduler Bot*
+
+Choose an option below:
+"""
+
+QUICK_HELP_MESSAGE = """
+📖 *Detailed Help*
+
+*Spreadsheet Format:*
+Your file must have a column named 'tweet'
+
+Example CSV:
+```
+tweet
+This is my first tweet!
+Another tweet here
+More content to share
+```
+
+*Commands:*
+/start - Main menu
+/status - Check queue
+/schedule - Set posting times
+/clear - Clear all tweets
+/help - Show this help
+"""
+
+UPLOAD_HELP_MESSAGE = """
+📤 *Upload Instructions*
+
+1. Prepare a CSV or Excel file (.csv, .xlsx, .xls)
+2. Add a column named 'tweet'
+3. Add your tweets (max 280 characters each)
+4. Send the file to this bot
+
+The bot will automatically process it!
+"""
+
+SCHEDULE_HELP_MESSAGE = """
+⏰ *Schedule Options*
+
+Click a preset or use custom command:
+
+*Custom:*
+/schedule 30m - Every 30 minutes
+/schedule 1h - Every hour
+/schedule 2h30m - Every 2.5 hours
+/schedule daily 09:00 - Daily at 9 AM
+"""
+
+EMPTY_QUEUE_MESSAGE = "📭 No tweets in queue. Upload a spreadsheet to get started!"
+
+POSTED_MESSAGE_PREFIX = "✅ *Tweet Posted!*\n\n📝 "
+TWEET_LINK_PREFIX = "🔗 [View Tweet](https://x.com/i/web/status/"
+
+MAIN_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📤 Upload Tweets", callback_data="help_upload"),
+        InlineKeyboardButton("📊 Check Status", callback_data="status")
+    ],
+    [
+        InlineKeyboardButton("⏰ Set Schedule", callback_data="help_schedule"),
+        InlineKeyboardButton("❓ Help", callback_data="help")
+    ],
+    [
+        InlineKeyboardButton("🗑️ Clear Queue", callback_data="confirm_clear")
+    ]
+])
+UPLOADED_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("⏰ Set Schedule", callback_data="help_schedule"),
+        InlineKeyboardButton("👀 Preview Tweets", callback_data="preview")
+    ],
+    [
+        InlineKeyboardButton("📊 View Status", callback_data="status"),
+        InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
+    ]
+])
+UPLOAD_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("📤 Upload Tweets", callback_data="help_upload")]])
+STATUS_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("👀 Preview Queue", callback_data="preview"),
+        InlineKeyboardButton("⏰ Schedule", callback_data="help_schedule")
+    ],
+    [
+        InlineKeyboardButton("🔄 Refresh", callback_data="status"),
+        InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
+    ]
+])
+BACK_TO_MENU_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Main Menu", callback_data="menu")]])
+POSTED_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📊 Check Status", callback_data="status"),
+        InlineKeyboardButton("👀 Preview Next", callback_data="preview")
+    ],
+    [
+        InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
+    ]
+])
+CLEAR_CONFIRM_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("✅ Yes, Clear All", callback_data="clear_confirm"),
+        InlineKeyboardButton("❌ Cancel", callback_data="menu")
+    ]
+])
+SCHEDULE_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("⏱️ Every 30 min", callback_data="schedule_30m"),
+        InlineKeyboardButton("⏰ Every 1 hour", callback_data="schedule_1h")
+    ],
+    [
+        InlineKeyboardButton("🕐 Every 2 hours", callback_data="schedule_2h"),
+        InlineKeyboardButton("🕒 Every 3 hours", callback_data="schedule_3h")
+    ],
+    [
+        InlineKeyboardButton("🌅 Daily 9 AM", callback_data="schedule_daily_09"),
+        InlineKeyboardButton("🌆 Daily 6 PM", callback_data="schedule_daily_18")
+    ],
+    [
+        InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
+    ]
+])
+PREVIEW_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📊 Full Status", callback_data="status"),
+        InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
+    ]
+])
+SCHEDULED_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📊 Check Status", callback_data="status"),
+        InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
+    ]
+])
+
+# Triggers are only read by the scheduler, so one instance per schedule is
+# shared by the presets and /schedule
+@functools.lru_cache(maxsize=32)
+def interval_trigger(minutes: int) -> IntervalTrigger:
+    return IntervalTrigger(minutes=minutes)
+
+@functools.lru_cache(maxsize=32)
+def daily_trigger(hour: int, minute: int) -> CronTrigger:
+    return CronTrigger(hour=hour, minute=minute)
+
+# Preset schedules offered by SCHEDULE_MENU_MARKUP: callback suffix -> (trigger, label)
+SCHEDULE_SPECS = {
+    "30m": (interval_trigger(1), "every minute (test mode)"),
+    "1h": (interval_trigger(60), "every 1 hour"),
+    "2h": (interval_trigger(120), "every 2 hours"),
+    "3h": (interval_trigger(180), "every 3 hours"),
+    "daily_09": (daily_trigger(9, 0), "daily at 9:00 AM"),
+    "daily_18": (daily_trigger(18, 0), "daily at 6:00 PM"),
+}
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send welcome message when /start command is issued"""
+    if not update.message:
+        return
+    
+    await update.message.reply_text(WELCOME_MESSAGE, parse_mode='Markdown', reply_markup=MAIN_MENU_MARKUP)
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send detailed help information"""
+    if not update.message:
+        return
+        
+    await update.message.reply_text(HELP_MESSAGE, parse_mode='Markdown')
+
+def filter_tweets(cells: Iterable[str]) -> Tuple[List[str], int]:
+    """Strip tweets and keep the ones between 1 and MAX_TWEET_LENGTH characters.
+    Returns (valid_tweets, skipped); callers drop empty cells beforehand.
+    """
+    texts = [c.strip() for c in cells]
+    valid = [t for t in texts if 0 < len(t) <= MAX_TWEET_LENGTH]
+    return valid, len(texts) - len(valid)
+
+def read_csv_tweets(data: bytearray) -> Optional[Tuple[List[str], int]]:
+    """Read and validate the 'tweet' column of a CSV upload.
+    Returns (valid_tweets, skipped), or None if there is no 'tweet' column.
     """
-    await update.message.reply_text(help_text, parse_mode='Markdown')
+    reader = csv.DictReader(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline=''))
+    if not reader.fieldnames or 'tweet' not in reader.fieldnames:
+        return None
+    return filter_tweets(row['tweet'] for row in reader if row['tweet'])
+
+def read_excel_tweets(data: bytearray) -> Optional[Tuple[List[str], int]]:
+    """Read and validate the 'tweet' column of the first sheet of a workbook.
+    Rows are streamed and only the 'tweet' cell is kept, so other columns
+    are never materialized. Returns None if there is no 'tweet' column.
+    """
+    sheet = CalamineWorkbook.from_filelike(io.BytesIO(data)).get_sheet_by_index(0)
+    # iter_rows() panics on a sheet with no cells, and the panic is not an
+    # Exception, so treat an empty sheet as having no header up front
+    if sheet.height == 0:
+        return None
+    rows = sheet.iter_rows()
+    header = next(rows, None)
+    if not header or 'tweet' not in header:
+        return None
+    idx = header.index('tweet')
+    cells = (row[idx] for row in rows if len(row) > idx and row[idx] != "")
+    # Excel stores every number as a float; show whole numbers without ".0"
+    return filter_tweets(
+        str(int(c)) if isinstance(c, float) and c.is_integer() else str(c) for c in cells
+    )
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle uploaded spreadsheet files"""
-    global tweet_queue
-    
     if not update.message or not update.message.document:
         return
     
@@ -263,36 +663,23 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         file = await context.bot.get_file(document.file_id)
-        file_path = f"temp_{document.file_name}"
-        await file.download_to_drive(file_path)
+        data = await file.download_as_bytearray()
         
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
+        parsed: Optional[Tuple[List[str], int]] = None
+        if file_name.endswith('.csv'):
+            parsed = read_csv_tweets(data)
         else:
-            df = pd.read_excel(file_path)
+            parsed = read_excel_tweets(data)
         
-        if 'tweet' not in df.columns:
+        if parsed is None:
             await update.message.reply_text(
                 "❌ Error: Spreadsheet must have a 'tweet' column"
             )
-            os.remove(file_path)
             return
         
-        tweets = df['tweet'].dropna().tolist()
+        valid_tweets, skipped = parsed
         
-        valid_tweets = []
-        skipped = 0
-        
-        for tweet in tweets:
-            tweet_text = str(tweet).strip()
-            if tweet_text and len(tweet_text) <= 280:
-                valid_tweets.append({'text': tweet_text, 'posted': False})
-            else:
-                skipped += 1
-        
-        tweet_queue = valid_tweets
-        
-        os.remove(file_path)
+        tweet_queue.replace(valid_tweets)
         
         message = f"""
 ✅ *File processed successfully!*
@@ -305,27 +692,13 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Choose what to do next:
         """
         
-        keyboard = [
-            [
-                InlineKeyboardButton("⏰ Set Schedule", callback_data="help_schedule"),
-                InlineKeyboardButton("👀 Preview Tweets", callback_data="preview")
-            ],
-            [
-                InlineKeyboardButton("📊 View Status", callback_data="status"),
-                InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(message, parse_mode='Markdown', reply_markup=reply_markup)
+        await update.message.reply_text(message, parse_mode='Markdown', reply_markup=UPLOADED_MARKUP)
         
     except Exception as e:
-        logger.error(f"Error processing file: {e}")
+        logger.error("Error processing file: %s", e)
         await update.message.reply_text(
             f"❌ Error processing file: {str(e)}"
         )
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show current queue status"""
@@ -334,23 +707,20 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global tweet_queue
     
     if not tweet_queue:
-        keyboard = [[InlineKeyboardButton("📤 Upload Tweets", callback_data="help_upload")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
-            "📭 No tweets in queue. Upload a spreadsheet to get started!",
-            reply_markup=reply_markup
+            EMPTY_QUEUE_MESSAGE,
+            reply_markup=UPLOAD_MARKUP
         )
         return
     
     total = len(tweet_queue)
-    posted = sum(1 for t in tweet_queue if t['posted'])
-    remaining = total - posted
+    posted = tweet_queue.posted_count
+    remaining = tweet_queue.remaining
     
     next_text = ""
-    if remaining > 0:
-        next_tweet = next((t for t in tweet_queue if not t['posted']), None)
-        if next_tweet:
-            next_text = f"\nNext: \"{next_tweet['text'][:50]}...\""
+    next_tweet = tweet_queue.next_preview()
+    if next_tweet:
+        next_text = f"\nNext: \"{next_tweet[:50]}...\""
     
     status_message = f"""
 📊 *Queue Status*
@@ -360,19 +730,7 @@ Total tweets: {total}
 ⏳ Remaining: {remaining}{next_text}
     """
     
-    keyboard = [
-        [
-            InlineKeyboardButton("👀 Preview Queue", callback_data="preview"),
-            InlineKeyboardButton("⏰ Schedule", callback_data="help_schedule")
-        ],
-        [
-            InlineKeyboardButton("🔄 Refresh", callback_data="status"),
-            InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(status_message, parse_mode='Markdown', reply_markup=reply_markup)
+    await update.message.reply_text(status_message, parse_mode='Markdown', reply_markup=STATUS_MARKUP)
 
 async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Set up posting schedule"""
@@ -389,14 +747,6 @@ async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         logger.info("No tweets in queue")
         return
-        
-    scheduler = get_scheduler()
-    if scheduler is None:
-        await update.message.reply_text("❌ Failed to initialize scheduler. Please try again.")
-        return
-        
-    scheduler.remove_all_jobs()
-    logger.info("Removed existing jobs")
     
     if not context.args:
         await update.message.reply_text(
@@ -412,25 +762,20 @@ async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Please specify a schedule interval")
         return
         
-    logger.info(f"Setting up schedule with args: {context.args}")
+    logger.info("Setting up schedule with args: %s", context.args)
     schedule_type = context.args[0].lower()
     
     try:
+        scheduler = get_scheduler()
         if schedule_type == 'daily' and len(context.args) > 1:
             time_str = context.args[1]
             hour, minute = map(int, time_str.split(':'))
             
-            scheduler = get_scheduler()
-            if scheduler is None:
-                await update.message.reply_text("❌ Failed to access scheduler. Please try again.")
-                return
-                
-            scheduler.add_job(
-                post_next_tweet,
-                CronTrigger(hour=hour, minute=minute),
-                args=[context.bot, update.effective_chat.id],
-                id='tweet_job',
-                replace_existing=True
+            set_tweet_job(
+                scheduler,
+                daily_trigger(hour, minute),
+                context.bot,
+                update.effective_chat.id
             )
             
             await update.message.reply_text(
@@ -447,20 +792,13 @@ async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if not chat_id:
                 await update.message.reply_text("❌ Could not determine chat ID")
                 return
-                
-            scheduler = get_scheduler()
-            if scheduler is None:
-                await update.message.reply_text("❌ Failed to access scheduler. Please try again.")
-                return
             
             actual_minutes = 1 if minutes == 30 else minutes
-            scheduler.add_job(
-                post_next_tweet,
-                'interval',
-                minutes=actual_minutes,
-                args=[context.bot, chat_id],
-                id='tweet_job',
-                replace_existing=True
+            set_tweet_job(
+                scheduler,
+                interval_trigger(actual_minutes),
+                context.bot,
+                chat_id
             )
             
             msg = f"✅ Scheduled to post every {interval_str}"
@@ -468,31 +806,28 @@ async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 msg += " (running every minute for testing)"
             await update.message.reply_text(msg)
         
-        logger.info(f"Schedule updated successfully. Scheduler running: {scheduler.running}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Schedule updated successfully. Scheduler running: %s", scheduler.running)
             
     except Exception as e:
-        logger.error(f"Error setting schedule: {e}")
+        logger.error("Error setting schedule: %s", e)
         await update.message.reply_text(
             f"❌ Error setting schedule: {str(e)}"
         )
 
+_INTERVAL_RE = re.compile(r'^(?:(\d+)h)?(?:(\d+)m)?$')
+
 def parse_interval(interval_str: str) -> int:
-    """Parse interval string to minutes"""
-    total_minutes = 0
+    """Parse interval string like 30m, 1h or 2h30m to minutes"""
+    match = _INTERVAL_RE.match(interval_str)
+    if match is None:
+        raise ValueError("Invalid interval")
     
-    if 'h' in interval_str:
-        hours = int(interval_str.split('h')[0])
-        total_minutes += hours * 60
-        interval_str = interval_str.split('h')[1] if 'h' in interval_str else ''
+    hours = int(match.group(1) or 0)
+    minutes = int(match.group(2) or 0)
+    total_minutes = max(1, hours * 60 + minutes)
     
-    if 'm' in interval_str:
-        minutes = int(interval_str.replace('m', ''))
-        total_minutes += minutes
-        
-    if total_minutes <= 0:
-        total_minutes = 1
-    
-    logger.info(f"Parsed interval: {interval_str} -> {total_minutes} minutes")
+    logger.info("Parsed interval: %s -> %s minutes", interval_str, total_minutes)
     return total_minutes
 
 async def post_next_tweet(bot, chat_id):
@@ -501,76 +836,53 @@ async def post_next_tweet(bot, chat_id):
     - On success: marks it posted, stores tweet_id/url/posted_at and sends the link
     - Stops schedule when all tweets are posted.
     """
-    global tweet_queue
-    
-    logger.info(f"Posting next tweet... Queue size: {len(tweet_queue)}")
+    logger.info("Posting next tweet... Queue size: %s", len(tweet_queue))
     
-    next_tweet = next((tweet for tweet in tweet_queue if not tweet.get('posted')), None)
-    logger.info(f"Found next tweet to post: {next_tweet is not None}")
+    next_tweet = tweet_queue.next_tweet()
+    logger.info("Found next tweet to post: %s", next_tweet is not None)
     
-    if not next_tweet:
-        keyboard = [[InlineKeyboardButton("🏠 Main Menu", callback_data="menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    if next_tweet is None:
         try:
             await bot.send_message(
                 chat_id=chat_id,
                 text="✅ All tweets have been posted!",
-                reply_markup=reply_markup
+                reply_markup=BACK_TO_MENU_MARKUP
             )
         except Exception as e:
-            logger.error(f"Failed to send Telegram message: {e}")
+            logger.error("Failed to send Telegram message: %s", e)
         
-        scheduler = get_scheduler()
-        if scheduler:
-            scheduler.remove_all_jobs()
-            logger.info("All tweets posted, scheduler jobs removed")
+        get_scheduler().remove_all_jobs()
+        logger.info("All tweets posted, scheduler jobs removed")
         return
     
+    row_id, tweet_text, preview = next_tweet
     try:
-        success, tweet_id = tweet_poster.post_tweet(next_tweet['text'])
+        success, tweet_id = await tweet_poster.post_tweet(tweet_text)
     except Exception as e:
-        logger.error(f"Error posting tweet: {e}")
+        logger.error("Error posting tweet: %s", e)
         success, tweet_id = False, None
     
     if success:
-        next_tweet['posted'] = True
+        tweet_queue.mark_posted(row_id, tweet_id)
+        remaining = tweet_queue.remaining
+        parts = [POSTED_MESSAGE_PREFIX, preview, "...\n" if len(tweet_text) > PREVIEW_LENGTH else "\n"]
         if tweet_id:
-            tweet_url = f"https://x.com/i/web/status/{tweet_id}"
-            next_tweet['tweet_id'] = tweet_id
-            next_tweet['tweet_url'] = tweet_url
-        next_tweet['posted_at'] = datetime.now().isoformat(timespec='seconds')
-        remaining = sum(1 for t in tweet_queue if not t.get('posted'))
-        keyboard = [
-            [
-                InlineKeyboardButton("📊 Check Status", callback_data="status"),
-                InlineKeyboardButton("👀 Preview Next", callback_data="preview")
-            ],
-            [
-                InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+            parts += [TWEET_LINK_PREFIX, tweet_id, ")\n"]
+        parts += ["\n⏳ ", str(remaining), " tweets remaining"]
         try:
             await bot.send_message(
                 chat_id=chat_id,
-                text=(
-                    "✅ *Tweet Posted!*\n\n"
-                    f"📝 {next_tweet['text'][:150]}{'...' if len(next_tweet['text']) > 150 else ''}\n"
-                    + (f"🔗 [View Tweet]({tweet_url})\n" if tweet_id else "")
-                    + f"\n⏳ {remaining} tweets remaining"
-                ),
+                text="".join(parts),
                 parse_mode='Markdown',
-                reply_markup=reply_markup,
+                reply_markup=POSTED_MARKUP,
                 disable_web_page_preview=True
             )
         except Exception as e:
-            logger.error(f"Failed to send Telegram message: {e}")
+            logger.error("Failed to send Telegram message: %s", e)
         
         if remaining == 0:
-            scheduler = get_scheduler()
-            if scheduler:
-                scheduler.remove_all_jobs()
-                logger.info("All tweets posted, removed scheduler jobs")
+            get_scheduler().remove_all_jobs()
+            logger.info("All tweets posted, removed scheduler jobs")
     else:
         try:
             await bot.send_message(
@@ -578,24 +890,15 @@ async def post_next_tweet(bot, chat_id):
                 text="❌ Failed to post tweet. Will retry next cycle."
             )
         except Exception as e:
-            logger.error(f"Failed to send Telegram message: {e}")
+            logger.error("Failed to send Telegram message: %s", e)
 
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Clear all scheduled tweets"""
     if not update.message:
         return
         
-    scheduler = get_scheduler()
-    has_jobs = scheduler and len(scheduler.get_jobs()) > 0 if scheduler else False
+    has_jobs = len(get_scheduler().get_jobs()) > 0
         
-    keyboard = [
-        [
-            InlineKeyboardButton("✅ Yes, Clear All", callback_data="clear_confirm"),
-            InlineKeyboardButton("❌ Cancel", callback_data="menu")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     message = "⚠️ Are you sure you want to clear all tweets"
     if has_jobs:
         message += " and stop the schedule"
@@ -603,307 +906,199 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(
         message,
-        reply_markup=reply_markup
+        reply_markup=CLEAR_CONFIRM_MARKUP
     )
 
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle inline button presses"""
-    if not update.callback_query:
-        return
-        
-    query = update.callback_query
-    if query is None:
-        return
-        
-    await query.answer()
-    
-    global tweet_queue, scheduler
-    
-    if query.data == "menu":
-        welcome_message = """
-🤖 *Tweet Scheduler Bot*
+async def _menu(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
+    await query.edit_message_text(MENU_MESSAGE, parse_mode='Markdown', reply_markup=MAIN_MENU_MARKUP)
 
-Choose an option below:
-        """
-        keyboard = [
-            [
-                InlineKeyboardButton("📤 Upload Tweets", callback_data="help_upload"),
-                InlineKeyboardButton("📊 Check Status", callback_data="status")
-            ],
-            [
-                InlineKeyboardButton("⏰ Set Schedule", callback_data="help_schedule"),
-                InlineKeyboardButton("❓ Help", callback_data="help")
-            ],
-            [
-                InlineKeyboardButton("🗑️ Clear Queue", callback_data="confirm_clear")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(welcome_message, parse_mode='Markdown', reply_markup=reply_markup)
-    
-    elif query.data == "help":
-        help_text = """
-📖 *Detailed Help*
+async def _help(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
+    await query.edit_message_text(QUICK_HELP_MESSAGE, parse_mode='Markdown', reply_markup=BACK_TO_MENU_MARKUP)
 
-*Spreadsheet Format:*
-Your file must have a column named 'tweet'
+async def _help_upload(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
+    await query.edit_message_text(UPLOAD_HELP_MESSAGE, parse_mode='Markdown', reply_markup=BACK_TO_MENU_MARKUP)
 
-Example CSV:
-```
-tweet
-This is my first tweet!
-Another tweet here
-More content to share
-```
+async def _help_schedule(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
+    await query.edit_message_text(SCHEDULE_HELP_MESSAGE, parse_mode='Markdown', reply_markup=SCHEDULE_MENU_MARKUP)
 
-*Commands:*
-/start - Main menu
-/status - Check queue
-/schedule - Set posting times
-/clear - Clear all tweets
-/help - Show this help
-        """
-        keyboard = [[InlineKeyboardButton("🏠 Main Menu", callback_data="menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(help_text, parse_mode='Markdown', reply_markup=reply_markup)
+async def _status(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
+    if not tweet_queue:
+        await query.edit_message_text(
+            EMPTY_QUEUE_MESSAGE,
+            reply_markup=UPLOAD_MARKUP
+        )
+        return
     
-    elif query.data == "help_upload":
-        message = """
-📤 *Upload Instructions*
-
-1. Prepare a CSV or Excel file (.csv, .xlsx, .xls)
-2. Add a column named 'tweet'
-3. Add your tweets (max 280 characters each)
-4. Send the file to this bot
-
-The bot will automatically process it!
-        """
-        keyboard = [[InlineKeyboardButton("🏠 Main Menu", callback_data="menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, parse_mode='Markdown', reply_markup=reply_markup)
+    total = len(tweet_queue)
+    posted = tweet_queue.posted_count
+    remaining = tweet_queue.remaining
     
-    elif query.data == "help_schedule":
-        message = """
-⏰ *Schedule Options*
-
-Click a preset or use custom command:
-
-*Custom:*
-/schedule 30m - Every 30 minutes
-/schedule 1h - Every hour
-/schedule 2h30m - Every 2.5 hours
-/schedule daily 09:00 - Daily at 9 AM
-        """
-        keyboard = [
-            [
-                InlineKeyboardButton("⏱️ Every 30 min", callback_data="schedule_30m"),
-                InlineKeyboardButton("⏰ Every 1 hour", callback_data="schedule_1h")
-            ],
-            [
-                InlineKeyboardButton("🕐 Every 2 hours", callback_data="schedule_2h"),
-                InlineKeyboardButton("🕒 Every 3 hours", callback_data="schedule_3h")
-            ],
-            [
-                InlineKeyboardButton("🌅 Daily 9 AM", callback_data="schedule_daily_09"),
-                InlineKeyboardButton("🌆 Daily 6 PM", callback_data="schedule_daily_18")
-            ],
-            [
-                InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(message, parse_mode='Markdown', reply_markup=reply_markup)
-    
-    elif query.data == "status":
-        if not tweet_queue:
-            keyboard = [[InlineKeyboardButton("📤 Upload Tweets", callback_data="help_upload")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(
-                "📭 No tweets in queue. Upload a spreadsheet to get started!",
-                reply_markup=reply_markup
-            )
-            return
-        
-        total = len(tweet_queue)
-        posted = sum(1 for t in tweet_queue if t['posted'])
-        remaining = total - posted
-        
-        next_text = ""
-        if remaining > 0:
-            next_tweet = next((t for t in tweet_queue if not t['posted']), None)
-            if next_tweet:
-                next_text = f"\nNext: \"{next_tweet['text'][:50]}...\""
-        
-        status_message = f"""
+    next_text = ""
+    next_tweet = tweet_queue.next_preview()
+    if next_tweet:
+        next_text = f"\nNext: \"{next_tweet[:50]}...\""
+    
+    status_message = f"""
 📊 *Queue Status*
 
 Total tweets: {total}
 ✅ Posted: {posted}
 ⏳ Remaining: {remaining}{next_text}
-        """
+    """
+    
+    await query.edit_message_text(status_message, parse_mode='Markdown', reply_markup=STATUS_MARKUP)
+
+async def _preview(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
+    if not tweet_queue:
+        await query.edit_message_text("📭 No tweets to preview!")
+        return
+    
+    unposted = tweet_queue.upcoming(5)
+    preview_text = "👀 *Next Tweets in Queue:*\n\n"
+    
+    for i, tweet in enumerate(unposted, 1):
+        preview_text += f"{i}. {tweet[:100]}{'...' if len(tweet) > 100 else ''}\n\n"
+    
+    if len(unposted) < tweet_queue.remaining:
+        preview_text += f"...and {tweet_queue.remaining - 5} more"
+    
+    await query.edit_message_text(preview_text, parse_mode='Markdown', reply_markup=PREVIEW_MARKUP)
+
+async def _confirm_clear(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
+    await query.edit_message_text(
+        "⚠️ Are you sure you want to clear all tweets and stop the schedule?",
+        reply_markup=CLEAR_CONFIRM_MARKUP
+    )
+
+async def _clear_confirm(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
+    tweet_queue.clear()
+    
+    get_scheduler().remove_all_jobs()
+    logger.info("Cleared scheduler jobs")
         
-        keyboard = [
-            [
-                InlineKeyboardButton("👀 Preview Queue", callback_data="preview"),
-                InlineKeyboardButton("⏰ Schedule", callback_data="help_schedule")
-            ],
-            [
-                InlineKeyboardButton("🔄 Refresh", callback_data="status"),
-                InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(status_message, parse_mode='Markdown', reply_markup=reply_markup)
-    
-    elif query.data == "preview":
-        if not tweet_queue:
-            await query.edit_message_text("📭 No tweets to preview!")
+    await query.edit_message_text(
+        "🗑️ All tweets cleared and schedule stopped!",
+        reply_markup=BACK_TO_MENU_MARKUP
+    )
+
+async def _edit_with_retry(query: CallbackQuery, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None, attempts: int = 3) -> None:
+    """Edit the button's message, waiting out Telegram flood control"""
+    for attempt in range(1, attempts + 1):
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup)
             return
-        
-        unposted = [t for t in tweet_queue if not t['posted']][:5]
-        preview_text = "👀 *Next Tweets in Queue:*\n\n"
-        
-        for i, tweet in enumerate(unposted, 1):
-            preview_text += f"{i}. {tweet['text'][:100]}{'...' if len(tweet['text']) > 100 else ''}\n\n"
-        
-        if len(unposted) < len([t for t in tweet_queue if not t['posted']]):
-            preview_text += f"...and {len([t for t in tweet_queue if not t['posted']]) - 5} more"
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("📊 Full Status", callback_data="status"),
-                InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(preview_text, parse_mode='Markdown', reply_markup=reply_markup)
-    
-    elif query.data == "confirm_clear":
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ Yes, Clear All", callback_data="clear_confirm"),
-                InlineKeyboardButton("❌ Cancel", callback_data="menu")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            "⚠️ Are you sure you want to clear all tweets and stop the schedule?",
-            reply_markup=reply_markup
-        )
+        except RetryAfter as e:
+            if attempt < attempts:
+                await asyncio.sleep(e.retry_after)
+        except TelegramError as e:
+            logger.error("Error editing message: %s", e)
+            return
+    logger.error("Gave up editing message after %s attempts", attempts)
+
+async def _schedule_preset(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE, schedule_type: str):
+    if not tweet_queue or not query.message or not query.message.chat:
+        await _edit_with_retry(query, "⚠️ Please upload tweets first!", reply_markup=UPLOAD_MARKUP)
+        return
     
-    elif query.data == "clear_confirm":
-        tweet_queue = []
-        
-        scheduler = get_scheduler()
-        if scheduler:
-            scheduler.remove_all_jobs()
-            logger.info("Cleared scheduler jobs")
-            
-        keyboard = [[InlineKeyboardButton("🏠 Main Menu", callback_data="menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(
-            "🗑️ All tweets cleared and schedule stopped!",
-            reply_markup=reply_markup
-        )
+    spec = SCHEDULE_SPECS.get(schedule_type)
+    if spec is None:
+        await _edit_with_retry(query, "❌ Unknown schedule option.", reply_markup=SCHEDULE_MENU_MARKUP)
+        return
     
-    elif query and query.data and query.data.startswith("schedule_"):
-        if not tweet_queue or not query.message or not query.message.chat:
-            keyboard = [[InlineKeyboardButton("📤 Upload Tweets", callback_data="help_upload")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(
-                "⚠️ Please upload tweets first!",
-                reply_markup=reply_markup
-            )
-            return
-        
-        schedule_type = query.data.replace("schedule_", "")
-        
+    trigger, label = spec
+    chat_id = query.message.chat.id
+    try:
         scheduler = get_scheduler()
-        if scheduler is None:
-            await query.edit_message_text("❌ Failed to initialize scheduler. Please try again.")
-            return
-            
-        scheduler.remove_all_jobs()
-        
-        try:
-            if not query or not query.message or not query.message.chat:
-                return
-            
-            scheduler = get_scheduler()
-            if scheduler is None:
-                await query.edit_message_text("❌ Failed to access scheduler. Please try again.")
-                return
-                
-            if schedule_type == "30m":
-                scheduler.add_job(post_next_tweet, 'interval', minutes=1,  
-                                args=[context.bot, query.message.chat.id],
-                                id='tweet_job', replace_existing=True)
-                msg = "✅ Scheduled to post every minute (test mode)!"
-            elif schedule_type == "1h" and query.message and query.message.chat:
-                scheduler.add_job(post_next_tweet, 'interval', hours=1, 
-                                args=[context.bot, query.message.chat.id],
-                                id='tweet_job', replace_existing=True)
-                msg = "✅ Scheduled to post every 1 hour!"
-            elif schedule_type == "2h" and query.message and query.message.chat:
-                scheduler.add_job(post_next_tweet, 'interval', hours=2, 
-                                args=[context.bot, query.message.chat.id],
-                                id='tweet_job', replace_existing=True)
-                msg = "✅ Scheduled to post every 2 hours!"
-            elif schedule_type == "3h" and query.message and query.message.chat:
-                scheduler.add_job(post_next_tweet, 'interval', hours=3, 
-                                args=[context.bot, query.message.chat.id],
-                                id='tweet_job', replace_existing=True)
-                msg = "✅ Scheduled to post every 3 hours!"
-            elif schedule_type == "daily_09" and query.message and query.message.chat:
-                scheduler.add_job(post_next_tweet, CronTrigger(hour=9, minute=0),
-                                args=[context.bot, query.message.chat.id],
-                                id='tweet_job', replace_existing=True)
-                msg = "✅ Scheduled to post daily at 9:00 AM!"
-            elif schedule_type == "daily_18" and query.message and query.message.chat:
-                scheduler.add_job(post_next_tweet, CronTrigger(hour=18, minute=0),
-                                args=[context.bot, query.message.chat.id],
-                                id='tweet_job', replace_existing=True)
-                msg = "✅ Scheduled to post daily at 6:00 PM!"
-            
-            scheduler = get_scheduler()
-            if scheduler is None:
-                await query.edit_message_text("❌ Failed to start scheduler. Please try again.")
-                return
-            
-            logger.info(f"Job scheduled successfully. Scheduler running: {scheduler.running}")
-            
-            keyboard = [
-                [
-                    InlineKeyboardButton("📊 Check Status", callback_data="status"),
-                    InlineKeyboardButton("🏠 Main Menu", callback_data="menu")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(msg, reply_markup=reply_markup)
-            
-        except Exception as e:
-            logger.error(f"Error setting schedule: {e}")
-            await query.edit_message_text(f"❌ Error setting schedule: {str(e)}")
+        existing = scheduler.get_job('tweet_job')
+        # Repeated clicks on the same option have nothing to write
+        unchanged = existing is not None and existing.args[1] == chat_id and str(existing.trigger) == str(trigger)
+        if not unchanged:
+            set_tweet_job(scheduler, trigger, context.bot, chat_id)
+    except (JobLookupError, ValueError) as e:
+        logger.error("Error setting schedule: %s", e)
+        await _edit_with_retry(query, f"❌ Error setting schedule: {str(e)}")
+        return
+    
+    if unchanged:
+        await _edit_with_retry(query, f"✅ Already scheduled: {label}", reply_markup=SCHEDULED_MARKUP)
+        return
+    
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Job scheduled successfully. Scheduler running: %s", scheduler.running)
+    await _edit_with_retry(query, f"✅ Scheduled to post {label}!", reply_markup=SCHEDULED_MARKUP)
+
+CALLBACK_HANDLERS: Dict[str, Callable[[CallbackQuery, ContextTypes.DEFAULT_TYPE], Awaitable[None]]] = {
+    "menu": _menu,
+    "help": _help,
+    "help_upload": _help_upload,
+    "help_schedule": _help_schedule,
+    "status": _status,
+    "preview": _preview,
+    "confirm_clear": _confirm_clear,
+    "clear_confirm": _clear_confirm,
+}
+
+# Updates are handled one at a time, but preset schedules are finished in
+# background tasks; this caps how many of those run at once
+_PRESET_SEM = asyncio.Semaphore(16)
+
+async def _bounded(coro: Awaitable[None]) -> None:
+    async with _PRESET_SEM:
+        await coro
+
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle inline button presses"""
+    query = update.callback_query
+    if query is None:
+        return
+    
+    is_preset = bool(query.data) and query.data.startswith("schedule_")
+    if is_preset and _PRESET_SEM.locked():
+        # Shed load with a quick reply instead of queueing behind the others
+        await query.answer("⏳ Busy, try again")
+        return
+    
+    await query.answer()
+    
+    if not query.data:
+        return
+    handler = CALLBACK_HANDLERS.get(query.data)
+    if handler is not None:
+        await handler(query, context)
+    elif is_preset:
+        # The button is already answered; set the job in the background so
+        # the dispatcher can move on, and the confirmation edit follows
+        context.application.create_task(
+            _bounded(_schedule_preset(query, context, query.data[len("schedule_"):])),
+            update=update
+        )
 
 def main():
     """Start the bot"""
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN)
+    if PUBLIC_URL:
+        builder = builder.updater(None)
+    else:
+        builder = builder.post_init(startup).post_shutdown(shutdown)
+    application = builder.build()
     
     logger.info("Bot starting - scheduler will be initialized when needed")
-
-    start_health_server(HEALTH_PORT)
-    start_health_ping(30, f"https://yapbot-933z.onrender.com/ready")
     
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("status", status_command))
-    application.add_handler(CommandHandler("schedule", schedule_command))
-    application.add_handler(CommandHandler("clear", clear_command))
-    application.add_handler(CallbackQueryHandler(button_handler))
-    application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    application.add_handlers([
+        CommandHandler("start", start),
+        CommandHandler("help", help_command),
+        CommandHandler("status", status_command),
+        CommandHandler("schedule", schedule_command),
+        CommandHandler("clear", clear_command),
+        CallbackQueryHandler(button_handler),
+        MessageHandler(filters.Document.ALL, handle_document),
+    ])
     
     logger.info("Bot started!")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if PUBLIC_URL:
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main()
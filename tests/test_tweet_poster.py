@@ -0,0 +1,39 @@
+import asyncio
+import json
+import os
+
+import httpx
+
+for name in ("TELEGRAM_BOT_TOKEN", "TWITTER_API_KEY", "TWITTER_API_SECRET",
+             "TWITTER_ACCESS_TOKEN", "TWITTER_ACCESS_SECRET", "TWITTER_BEARER_TOKEN"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("QUEUE_DB_PATH", ":memory:")
+
+import bot  # noqa: E402
+
+
+def test_post_tweet_sends_signed_json_body():
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["body"] = json.loads(request.content)
+        seen["auth"] = request.headers.get("Authorization", "")
+        return httpx.Response(201, json={"data": {"id": "123", "text": "hello"}})
+
+    async def run():
+        poster = bot.TweetPoster()
+        await poster.client.aclose()
+        poster.client = httpx.AsyncClient(
+            base_url=bot.TWITTER_API_URL,
+            transport=httpx.MockTransport(handler),
+            auth=bot.OAuth1HeaderAuth("key", "secret", "token", "token_secret")
+        )
+        try:
+            return await poster.post_tweet("hello")
+        finally:
+            await poster.aclose()
+
+    assert asyncio.run(run()) == (True, "123")
+    assert seen["body"] == {"text": "hello"}
+    assert seen["auth"].startswith("OAuth ")
+    assert "oauth_body_hash" not in seen["auth"]